@@ -5,29 +5,239 @@ NCBI GenBank Data Retriever with Sequence Length Filtering, CSV Report, and Visu
 
 from Bio import Entrez
 from Bio import SeqIO
+import argparse
+import contextlib
 import csv
+import hashlib
+import io
+import itertools
+import operator
 import os
+import tempfile
+import threading
+import time
+import xml.etree.ElementTree as ET
+from collections import deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+import matplotlib
+matplotlib.use("Agg")  # Render straight to files; no GUI backend probing
 import matplotlib.pyplot as plt  # For plotting
+import numpy as np
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+try:
+    import gb_io  # Optional Rust GenBank parser, much faster than SeqIO
+except ImportError:
+    gb_io = None
+
+EUTILS_URL = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils/"
+REQUEST_TIMEOUT = (10, 120)  # Connect and read timeouts for E-utilities calls (seconds)
+CACHE_DIR = ".entrez_cache"
+CACHE_TTL = 24 * 60 * 60  # Cached responses expire after one day (seconds)
+NCBI_RATE_WITH_KEY = 9  # Requests per second, just under NCBI's limit of 10 with an API key
+NCBI_RATE_WITHOUT_KEY = 2  # NCBI allows 3 per second without a key
+CSV_HEADER = ("Accession Number", "Sequence Length", "Description")
+WRITE_BUFFER = 1 << 20  # Output file buffer size (1 MB)
+PLOT_MAX_POINTS = 500  # Longer series are downsampled before plotting
+PLOT_MAX_LABELS = 100  # Accession labels are hidden above this many points
+
+# Shared HTTP session so consecutive E-utilities calls reuse keep-alive connections
+_session = requests.Session()
+_session.mount("https://", HTTPAdapter(
+    pool_connections=4,
+    pool_maxsize=16,
+    max_retries=Retry(total=5, backoff_factor=0.5, status_forcelist=(429, 500, 502, 503, 504)),
+))
+
+# Lightweight stand-in for SeqRecord, carrying only the fields the reports use
+SeqRecordLike = namedtuple("SeqRecordLike", ["id", "seq", "description"])
+
+
+def parse_genbank(handle):
+    """Yield records from a binary GenBank handle, using gb-io when it is installed."""
+    if gb_io is None:
+        yield from SeqIO.parse(io.TextIOWrapper(handle, encoding="utf-8"), "genbank")
+        return
+    for record in gb_io.iter(handle):
+        # Match SeqIO: ACCESSION.VERSION as the ID and a one-line definition without the final period
+        description = " ".join((record.definition or "").split())
+        if description.endswith("."):
+            description = description[:-1]
+        yield SeqRecordLike(record.version or record.accession or record.name, record.sequence, description)
+
+
+def lttb_indices(values, n_out):
+    """Pick `n_out` indices of `values` that keep the curve's shape (Largest-Triangle-Three-Buckets)."""
+    n = len(values)
+    if n <= n_out or n_out < 3:
+        return np.arange(n)
+    y = np.asarray(values, dtype=float)
+    x = np.arange(n, dtype=float)
+    # First and last points are always kept; the rest are split into n_out - 2 buckets
+    edges = np.linspace(1, n - 1, n_out - 1).astype(int)
+    indices = np.empty(n_out, dtype=int)
+    indices[0], indices[-1] = 0, n - 1
+    prev = 0
+    for i in range(n_out - 2):
+        start, end = edges[i], edges[i + 1]
+        # Average of the following bucket (just the last point for the final bucket)
+        next_end = edges[i + 2] if i + 2 < len(edges) else n
+        avg_x = x[end:next_end].mean()
+        avg_y = y[end:next_end].mean()
+        # Keep the point forming the largest triangle with the previous pick and that average
+        area = np.abs((x[prev] - avg_x) * (y[start:end] - y[prev])
+                      - (x[prev] - x[start:end]) * (avg_y - y[prev]))
+        prev = start + int(np.argmax(area))
+        indices[i + 1] = prev
+    return indices
+
+
+class RateLimiter:
+    def __init__(self, rate):
+        """Token bucket that lets at most `rate` requests per second through, across threads."""
+        self.rate = rate
+        self.tokens = 1.0
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Block until the caller may send its next request."""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(1.0, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            # Reserve a token now; a negative balance makes later callers wait longer
+            self.tokens -= 1
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0
+        if wait:
+            time.sleep(wait)
+
+
+class FetchError(Exception):
+    """Raised when GenBank records cannot be downloaded or parsed."""
+
+
+class ResponseCache:
+    def __init__(self, directory=CACHE_DIR, ttl=CACHE_TTL):
+        """Keep raw E-utilities responses on disk for `ttl` seconds (raises OSError if unusable)."""
+        self.directory = directory
+        self.ttl = ttl
+        os.makedirs(directory, exist_ok=True)
+        self._prune()
+
+    def _prune(self):
+        """Delete expired entries and leftover temporary files."""
+        now = time.time()
+        for entry in os.scandir(self.directory):
+            with contextlib.suppress(OSError):
+                if entry.is_file() and now - entry.stat().st_mtime > self.ttl:
+                    os.remove(entry.path)
+
+    def _path(self, key):
+        """Map a request key to its cache file."""
+        return os.path.join(self.directory, hashlib.md5(key.encode()).hexdigest())
+
+    def get(self, key):
+        """Return the cached bytes for `key`, or None if missing or expired."""
+        path = self._path(key)
+        try:
+            if time.time() - os.path.getmtime(path) > self.ttl:
+                os.remove(path)
+                return None
+            with open(path, "rb") as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def set(self, key, data):
+        """Store bytes for `key`, replacing the file atomically; I/O errors are ignored."""
+        tmp_path = None
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=self.directory)
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, self._path(key))
+            tmp_path = None
+        except OSError:
+            pass  # Caching is best-effort; the caller already has the data
+        finally:
+            if tmp_path is not None:
+                with contextlib.suppress(OSError):
+                    os.remove(tmp_path)
 
 
 class NCBIRetriever:
-    def __init__(self, email, api_key):
+    def __init__(self, email, api_key, use_cache=True):
         """Initialize with NCBI credentials."""
         self.email = email
         self.api_key = api_key
         Entrez.email = email
         Entrez.api_key = api_key
         Entrez.tool = 'BioScriptEx10'
+        self.cache = None
+        if use_cache:
+            try:
+                self.cache = ResponseCache()
+            except OSError as e:
+                print(f"Response cache disabled: {e}")
+        self.rate_limiter = RateLimiter(NCBI_RATE_WITH_KEY if api_key else NCBI_RATE_WITHOUT_KEY)
+        self._taxonomy_names = {}  # Scientific names already looked up, by TaxID
+        self._figure = None
+        self._ax = None
+
+    def _eutils(self, utility, **params):
+        """Call an E-utilities endpoint over the shared session and return a binary handle."""
+        params.update(tool=Entrez.tool, email=self.email, api_key=self.api_key)
+        params = {key: value for key, value in params.items() if value not in (None, "")}
+        self.rate_limiter.acquire()
+        response = _session.get(f"{EUTILS_URL}{utility}.fcgi", params=params, stream=True,
+                                timeout=REQUEST_TIMEOUT)
+        response.raise_for_status()
+        # Let urllib3 undo any transfer encoding so the handle yields plain bytes
+        response.raw.decode_content = True
+        return response.raw
+
+    def _cached_eutils(self, key, utility, **params):
+        """Like _eutils, but serve the raw response from the disk cache when possible."""
+        if self.cache is None:
+            return self._eutils(utility, **params)
+        data = self.cache.get(key)
+        if data is None:
+            handle = self._eutils(utility, **params)
+            data = handle.read()
+            handle.close()
+            self.cache.set(key, data)
+        return io.BytesIO(data)
+
+    def _taxonomy_name(self, taxid):
+        """Look up the scientific name for a taxonomic ID (memoized, and disk-cached with the cache on)."""
+        if taxid in self._taxonomy_names:
+            return self._taxonomy_names[taxid]
+        handle = self._cached_eutils(
+            f"taxonomy:{taxid}:0:1", "efetch", db="taxonomy", id=taxid, retmode="xml"
+        )
+        try:
+            # Stream the XML and stop at the first name: the taxon's own precedes its lineage
+            for _, elem in ET.iterparse(handle, events=("end",)):
+                if elem.tag == "ScientificName":
+                    self._taxonomy_names[taxid] = elem.text
+                    return elem.text
+        finally:
+            handle.close()
+        raise ValueError(f"No taxonomy record found for TaxID {taxid}")
 
-    def search_taxid(self, taxid, min_length=None, max_length=None):
-        """Search for all records matching a taxonomic ID with length filtering."""
+    def search_taxid(self, taxid, min_length=None, max_length=None, verbose=False):
+        """Search for all records matching a taxonomic ID with length filtering (organism name only if verbose)."""
         print(f"Searching for records with taxID: {taxid}")
         try:
             # Fetch taxonomic information
-            handle = Entrez.efetch(db="taxonomy", id=taxid, retmode="xml")
-            records = Entrez.read(handle)
-            organism_name = records[0]["ScientificName"]
-            print(f"Organism: {organism_name} (TaxID: {taxid})")
+            if verbose:
+                organism_name = self._taxonomy_name(taxid)
+                print(f"Organism: {organism_name} (TaxID: {taxid})")
+            else:
+                organism_name = f"TaxID {taxid}"
 
             # Create search term with length filters
             search_term = f"txid{taxid}[Organism]"
@@ -36,9 +246,12 @@ class NCBIRetriever:
             if max_length:
                 search_term += f" AND 0:{max_length}[SLEN]"  # Maximum length
 
-            # Perform search
-            handle = Entrez.esearch(db="nucleotide", term=search_term, usehistory="y")
-            search_results = Entrez.read(handle)
+            # Perform search (not cached: WebEnv is a short-lived server-side session)
+            handle = self._eutils("esearch", db="nucleotide", term=search_term, usehistory="y")
+            try:
+                search_results = Entrez.read(handle)
+            finally:
+                handle.close()
             count = int(search_results["Count"])
 
             if count == 0:
@@ -50,88 +263,171 @@ class NCBIRetriever:
             # Store search results for later fetching
             self.webenv = search_results["WebEnv"]
             self.query_key = search_results["QueryKey"]
+            self.search_term = search_term
             self.count = count
             return count
         except Exception as e:
             print(f"Error searching TaxID {taxid}: {e}")
             return None
 
-    def fetch_records(self, start=0, max_records=10):
-        """Fetch a batch of records using the stored search results."""
+    def iter_records(self, start=0, total=None, batch_size=500):
+        """Stream records using the stored search results, fetching them in batches (raises FetchError)."""
         if not hasattr(self, 'webenv') or not hasattr(self, 'query_key'):
             print("No search results to fetch. Run search_taxid() first.")
-            return []
+            return
+        # Default to every record found by the search
+        end = self.count if total is None else min(self.count, start + total)
+        retstart = start
         try:
-            # Limit to prevent server overload
-            batch_size = min(max_records, 500)
-            handle = Entrez.efetch(
-                db="nucleotide",
-                rettype="gb",
-                retmode="text",
-                retstart=start,
-                retmax=batch_size,
-                webenv=self.webenv,
-                query_key=self.query_key
-            )
-            return list(SeqIO.parse(handle, "genbank"))  # Parse GenBank records into a list
+            while retstart < end:
+                # Limit to prevent server overload
+                retmax = min(batch_size, 500, end - retstart)
+                handle = self._open_batch(retstart, retmax)
+                try:
+                    # Parsing is lazy, so records are yielded as they are read
+                    yield from parse_genbank(handle)
+                finally:
+                    # Release the connection even if parsing fails or the consumer stops early
+                    handle.close()
+                retstart += retmax
         except Exception as e:
-            print(f"Error fetching records: {e}")
-            return []
+            raise FetchError(e) from e
+
+    def fetch_all_parallel(self, start=0, total=None, workers=8, batch_size=500):
+        """Like iter_records, but fetch the batches concurrently; records are still yielded in order."""
+        if not hasattr(self, 'webenv') or not hasattr(self, 'query_key'):
+            print("No search results to fetch. Run search_taxid() first.")
+            return
+        # Default to every record found by the search
+        end = self.count if total is None else min(self.count, start + total)
+        # Limit to prevent server overload
+        batch_size = min(batch_size, 500)
+        batches = [(retstart, min(batch_size, end - retstart)) for retstart in range(start, end, batch_size)]
+        # Workers share the session's connection pool and the rate limiter
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            # Keep at most `workers` batches in flight so parsed records never pile up in memory
+            pending = deque()
+            try:
+                for batch in batches:
+                    pending.append(executor.submit(self._fetch_batch, batch))
+                    if len(pending) >= workers:
+                        yield from pending.popleft().result()
+                while pending:
+                    yield from pending.popleft().result()
+            except Exception as e:
+                raise FetchError(e) from e
+            finally:
+                # Drop queued batches if the consumer stops early or a batch fails
+                for future in pending:
+                    future.cancel()
+
+    def _open_batch(self, retstart, retmax):
+        """Return a binary GenBank handle for one slice of the stored search results."""
+        return self._cached_eutils(
+            f"nucleotide:{self.search_term}:{retstart}:{retmax}",
+            "efetch",
+            db="nucleotide",
+            rettype="gb",
+            retmode="text",
+            retstart=retstart,
+            retmax=retmax,
+            webenv=self.webenv,
+            query_key=self.query_key
+        )
+
+    def _fetch_batch(self, batch):
+        """Download and parse one (start, size) batch of records."""
+        retstart, retmax = batch
+        handle = self._open_batch(retstart, retmax)
+        try:
+            return list(parse_genbank(handle))
+        finally:
+            handle.close()
 
-    def generate_csv_report(self, records, output_file):
-        """Generate a CSV report with record details."""
+    def emit_reports(self, records, csv_file, plot_file):
+        """Write the CSV report and the length plot in a single pass over `records`."""
+        # Only (accession, length, description) tuples are kept, not the records themselves
+        pairs = []
+        csvfile = None
         try:
-            with open(output_file, mode="w", newline="", encoding="utf-8") as csvfile:
+            with open(csv_file, mode="w", newline="", encoding="utf-8", buffering=WRITE_BUFFER) as csvfile:
                 writer = csv.writer(csvfile)
                 # Write CSV header
-                writer.writerow(["Accession Number", "Sequence Length", "Description"])
+                writer.writerow(CSV_HEADER)
 
-                # Write record details
+                # Write record details as they arrive, measuring each sequence once
                 for record in records:
-                    accession = record.id
-                    length = len(record.seq)
-                    description = record.description
-                    writer.writerow([accession, length, description])
-
-            print(f"CSV report saved to {output_file}")
+                    row = (record.id, len(record.seq), record.description)
+                    pairs.append(row)
+                    writer.writerow(row)
         except Exception as e:
+            # Never leave a truncated report behind
+            if csvfile is not None:
+                with contextlib.suppress(OSError):
+                    os.remove(csv_file)
+            if isinstance(e, FetchError):
+                raise
             print(f"Error generating CSV report: {e}")
+            # The plot does not depend on the CSV, so keep reading records for it
+            pairs.extend((record.id, len(record.seq), record.description) for record in records)
+        else:
+            print(f"CSV report saved to {csv_file}")
+
+        self.generate_plot(pairs, plot_file)
+        return pairs
 
-    def generate_plot(self, records, output_file):
+    def generate_plot(self, pairs, output_file):
         """Generate and save a line plot showing sequence lengths."""
         try:
             # Sort records by sequence length in descending order
-            sorted_records = sorted(records, key=lambda rec: len(rec.seq), reverse=True)
+            sorted_pairs = sorted(pairs, key=operator.itemgetter(1), reverse=True)
 
             # Extract accession numbers and lengths
-            accession_numbers = [record.id for record in sorted_records]
-            sequence_lengths = [len(record.seq) for record in sorted_records]
-
-            # Create the plot
-            plt.figure(figsize=(10, 6))
-            plt.plot(accession_numbers, sequence_lengths, marker='o', linestyle='-', color='b', label='Sequence Length')
-            plt.xlabel("Accession Number")
-            plt.ylabel("Sequence Length")
-            plt.title("GenBank Records Sorted by Sequence Length")
-            plt.xticks(rotation=90, fontsize=8)
-            plt.tight_layout()  # Adjust layout to prevent clipping
-            plt.legend()
+            accession_numbers = [accession for accession, _, _ in sorted_pairs]
+            sequence_lengths = [length for _, length, _ in sorted_pairs]
+
+            # Downsample long series; points stay at their rank so the curve keeps its shape
+            positions = lttb_indices(sequence_lengths, PLOT_MAX_POINTS)
+            plotted_lengths = [sequence_lengths[i] for i in positions]
+
+            # Create the plot, reusing the figure from earlier calls
+            if self._figure is None:
+                # Constrained layout prevents clipping in a single layout pass
+                self._figure, self._ax = plt.subplots(figsize=(10, 6), constrained_layout=True)
+            ax = self._ax
+            ax.clear()
+            ax.plot(positions, plotted_lengths, marker='o', linestyle='-', color='b', label='Sequence Length',
+                    rasterized=True)
+            ax.set_ylabel("Sequence Length")
+            ax.set_title("GenBank Records Sorted by Sequence Length")
+            if len(accession_numbers) <= PLOT_MAX_LABELS:
+                ax.set_xlabel("Accession Number")
+                ax.set_xticks(positions, accession_numbers, rotation=90, fontsize=8)
+            else:
+                # Too many records to label legibly; x values are rank positions
+                ax.set_xlabel("Rank (sorted by length)")
+                ax.set_xticks([])
+            ax.legend()
 
             # Save the plot as a PNG file
-            plt.savefig(output_file)
+            self._figure.savefig(output_file, dpi=100)
             print(f"Plot saved to {output_file}")
-            plt.close()
         except Exception as e:
             print(f"Error generating plot: {e}")
 
 
 def main():
+    parser = argparse.ArgumentParser(description="Retrieve GenBank records for a taxonomic ID.")
+    parser.add_argument("--no-cache", action="store_true",
+                        help=f"Always query NCBI instead of reusing responses cached in {CACHE_DIR}")
+    args = parser.parse_args()
+
     # Get user credentials for NCBI
     email = input("Enter your email address for NCBI: ")
     api_key = input("Enter your NCBI API key: ")
 
     # Create retriever object
-    retriever = NCBIRetriever(email, api_key)
+    retriever = NCBIRetriever(email, api_key, use_cache=not args.no_cache)
 
     # Get taxonomic ID and length filters from the user
     taxid = input("Enter taxonomic ID (taxid) of the organism: ")
@@ -143,25 +439,27 @@ def main():
         min_length, max_length = None, None
 
     # Search for records
-    count = retriever.search_taxid(taxid, min_length=min_length, max_length=max_length)
+    count = retriever.search_taxid(taxid, min_length=min_length, max_length=max_length, verbose=True)
     if not count:
         print("No records found. Exiting.")
         return
 
     # Fetch records
     print("\nFetching records...")
-    records = retriever.fetch_records(start=0, max_records=10)
-    if not records:
-        print("No records fetched. Exiting.")
-        return
-
-    # Generate CSV report
-    output_csv_file = f"taxid_{taxid}_report.csv"
-    retriever.generate_csv_report(records, output_csv_file)
+    records = retriever.iter_records(start=0, total=10)
+    try:
+        first_record = next(records, None)
+        if first_record is None:
+            print("No records fetched. Exiting.")
+            return
 
-    # Generate Plot
-    output_plot_file = f"taxid_{taxid}_plot.png"
-    retriever.generate_plot(records, output_plot_file)
+        # Generate CSV report and plot while the records stream in
+        output_csv_file = f"taxid_{taxid}_report.csv"
+        output_plot_file = f"taxid_{taxid}_plot.png"
+        retriever.emit_reports(itertools.chain([first_record], records), output_csv_file, output_plot_file)
+    except FetchError as e:
+        print(f"Error fetching records: {e}")
+        print("No records fetched. Exiting.")
 
 
 if __name__ == "__main__":
@@ -14,9 +14,13 @@ Kontekst zastosowania:
 """
 
 # Import bibliotek standardowych
-import random      # do losowania nukleotydów i pozycji
+import random      # do losowania pozycji tagu
 import argparse    # do obsługi argumentów wiersza poleceń
 import os          # do obsługi operacji na ścieżkach i katalogach
+import re          # do walidacji ID sekwencji
+
+# Import bibliotek zewnętrznych
+import numpy as np  # do szybkiego losowania i zliczania nukleotydów na buforze bajtów
 
 # === Ulepszenie 1: niestandardowa nazwa tagu ===
 # ORIGINAL:
@@ -28,6 +32,18 @@ TAG_NAME = input('Podaj nazwę tagu (domyślnie AAA): ').strip() or 'AAA'
 # Stałe formatujące
 INSERT_WIDTH = len(TAG_NAME)   # długość tagu, używana przy wstawianiu
 LINE_WIDTH = 60               # szerokość linii w pliku FASTA
+CHUNK_LINES = 16384           # liczba linii FASTA zapisywanych jednym wywołaniem write()
+WRITE_BUFFER = 1 << 20        # rozmiar bufora pliku wyjściowego (1 MB)
+# Import Numby i wczytanie skompilowanego jądra kosztują ok. 0.4 s, a jądro oszczędza
+# ok. 3.4 ms na milion nukleotydów względem np.bincount - opłaca się dopiero powyżej ~10^8
+JIT_MIN_LENGTH = 2 * 10**8    # minimalna długość sekwencji zliczanej przez Numbę
+
+# Dozwolone ID: litery (także polskie), cyfry i podkreślenia, z co najmniej jedną literą lub cyfrą
+# (ten sam zbiór co dawne raw_id.replace('_', '').isalnum())
+_ID_RE = re.compile(r'\A_*[^\W_]\w*\Z')
+
+# Jądro skompilowane przez Numbę (None: jeszcze nie ładowane, False: Numba niedostępna)
+_count_acgt_jit = None
 
 
 def generate_dna_sequence(length: int) -> str:
@@ -36,7 +52,58 @@ def generate_dna_sequence(length: int) -> str:
     :param length: liczba nukleotydów do wygenerowania
     :return: ciąg znaków złożony z A, C, G i T
     """
-    return ''.join(random.choices('ACGT', k=length))
+    # Losowanie indeksów 0-3 i mapowanie ich na bajty 'ACGT' bez tworzenia obiektu na nukleotyd
+    nuc = np.frombuffer(b'ACGT', dtype=np.uint8)
+    out = nuc[np.random.randint(0, 4, size=length, dtype=np.uint8)]
+    return out.tobytes().decode('ascii')
+
+
+def _count_acgt_loop(buf):
+    """
+    Zlicza bajty A, C, G i T w jednym przebiegu (pętla kompilowana przez Numbę).
+    :param buf: sekwencja jako tablica uint8
+    :return: krotka (A, C, G, T)
+    """
+    a = c = g = t = 0
+    for i in range(buf.size):
+        b = buf[i]
+        # Dodawanie wyników porównań zamiast rozgałęzień pozwala LLVM zwektoryzować pętlę
+        a += b == 65
+        c += b == 67
+        g += b == 71
+        t += b == 84
+    return a, c, g, t
+
+
+def _load_count_acgt_jit():
+    """
+    Importuje Numbę i kompiluje jądro zliczające przy pierwszym użyciu.
+    :return: skompilowane jądro lub None, jeśli Numba nie jest zainstalowana
+    """
+    global _count_acgt_jit
+    if _count_acgt_jit is None:
+        try:
+            import numba
+        except ImportError:
+            _count_acgt_jit = False
+        else:
+            _count_acgt_jit = numba.njit(cache=True, boundscheck=False)(_count_acgt_loop)
+    return _count_acgt_jit or None
+
+
+def _count_acgt(buf):
+    """
+    Zlicza bajty A, C, G i T w jednym przebiegu.
+    Krótkie sekwencje liczy np.bincount; Numba jest ładowana dopiero od JIT_MIN_LENGTH.
+    :param buf: sekwencja jako tablica uint8
+    :return: krotka (A, C, G, T)
+    """
+    if buf.size >= JIT_MIN_LENGTH:
+        kernel = _load_count_acgt_jit()
+        if kernel is not None:
+            return kernel(buf)
+    counts_arr = np.bincount(buf, minlength=128)
+    return tuple(counts_arr[ord(nuc)] for nuc in 'ACGT')
 
 
 def compute_stats(sequence: str) -> dict:
@@ -46,8 +113,9 @@ def compute_stats(sequence: str) -> dict:
     :return: słownik z liczbami, procentami i stosunkiem C+G / A+T
     """
     length = len(sequence)
-    # Zliczanie każdego nukleotydu
-    counts = {nuc: sequence.count(nuc) for nuc in 'ACGT'}
+    # Zliczanie wszystkich nukleotydów w jednym przebiegu po buforze bajtów
+    arr = np.frombuffer(sequence.encode('ascii'), dtype=np.uint8)
+    counts = {nuc: int(n) for nuc, n in zip('ACGT', _count_acgt(arr))}
     # Procentowa zawartość każdego nukleotydu
     percents = {nuc: (counts[nuc] / length) * 100 for nuc in counts}
     cg = counts['C'] + counts['G']
@@ -56,20 +124,40 @@ def compute_stats(sequence: str) -> dict:
     return {'counts': counts, 'percents': percents, 'cg_at_ratio': ratio}
 
 
-def format_fasta(seq_id: str, sequence: str, description: str = '') -> str:
+def format_fasta(f, seq_id: str, sequence: bytes | str, description: str = '') -> None:
     """
-    Formatuje sekwencję wraz z tagiem do formatu FASTA.
+    Zapisuje sekwencję wraz z tagiem w formacie FASTA do otwartego pliku.
+    :param f: plik otwarty do zapisu binarnego
     :param seq_id: identyfikator sekwencji
-    :param sequence: sekwencja DNA z wstawionym tagiem
+    :param sequence: sekwencja DNA z wstawionym tagiem (bytes/bytearray lub str dla tagu spoza ASCII)
     :param description: tekst opisu umieszczany w nagłówku FASTA
-    :return: gotowy tekst w formacie FASTA
     """
     header = f">{seq_id} {description}".strip()
-    # Zawijanie sekwencji co LINE_WIDTH znaków
-    wrapped = '\n'.join(
-        sequence[i:i+LINE_WIDTH] for i in range(0, len(sequence), LINE_WIDTH)
-    )
-    return f"{header}\n{wrapped}\n"
+    f.write(header.encode('utf-8'))
+    f.write(b'\n')
+    chunk = CHUNK_LINES * LINE_WIDTH
+    if isinstance(sequence, str):
+        # Tag spoza ASCII zajmuje kilka bajtów na znak, więc zawijamy po znakach, a nie po bajtach
+        for i in range(0, len(sequence), chunk):
+            block = sequence[i:i+chunk]
+            f.write('\n'.join(block[j:j+LINE_WIDTH] for j in range(0, len(block), LINE_WIDTH)).encode('utf-8'))
+            f.write(b'\n')
+        return
+    # Zapis porcjami po CHUNK_LINES linii, aby nie budować całego tekstu w pamięci
+    arr = np.frombuffer(sequence, dtype=np.uint8)
+    for i in range(0, len(arr), chunk):
+        block = arr[i:i+chunk]
+        full = len(block) // LINE_WIDTH
+        # Pełne linie: macierz (full, LINE_WIDTH) z dodatkową kolumną znaków nowej linii
+        lines = np.empty((full, LINE_WIDTH + 1), dtype=np.uint8)
+        lines[:, :LINE_WIDTH] = block[:full * LINE_WIDTH].reshape(full, LINE_WIDTH)
+        lines[:, LINE_WIDTH] = ord('\n')
+        f.write(lines.data)
+        # Niepełna ostatnia linia (tylko w ostatniej porcji)
+        rest = block[full * LINE_WIDTH:]
+        if rest.size:
+            f.write(rest.data)
+            f.write(b'\n')
 
 
 def main():
@@ -106,7 +194,7 @@ def main():
         # seq_id = input(f'Podaj ID dla sekwencji {i}: ').strip()
         # MODIFIED (ID musi zawierać tylko litery, cyfry lub podkreślenia):
         raw_id = input(f'Podaj ID dla sekwencji {i}: ').strip()
-        if not raw_id or not raw_id.replace('_', '').isalnum():
+        if not _ID_RE.match(raw_id):
             print('Nieprawidłowe ID. Użyj tylko liter, cyfr i podkreśleń.')
             return
         seq_id = raw_id
@@ -120,15 +208,20 @@ def main():
 
         # Wstawienie tagu w losowym miejscu
         insert_pos = random.randint(0, len(seq))
-        seq_with_tag = seq[:insert_pos] + TAG_NAME + seq[insert_pos:]
+        if TAG_NAME.isascii():
+            # W miejscu, w buforze bajtów, bez kopii fragmentów
+            seq_with_tag = bytearray(seq, 'ascii')
+            seq_with_tag[insert_pos:insert_pos] = TAG_NAME.encode('ascii')
+        else:
+            # Tag z polskimi literami: zwykłe łączenie napisów, zawijanie po znakach
+            seq_with_tag = seq[:insert_pos] + TAG_NAME + seq[insert_pos:]
 
-        # Formatowanie i zapis do pliku
-        fasta_content = format_fasta(seq_id, seq_with_tag, description)
         # Ścieżka pliku: katalog + nazwa ID.fasta
         filepath = os.path.join(args.outdir, f"{seq_id}.fasta")
+        # Formatowanie i zapis do pliku przez duży bufor (mało wywołań systemowych)
         try:
-            with open(filepath, 'w') as f:
-                f.write(fasta_content)
+            with open(filepath, 'wb', buffering=WRITE_BUFFER) as f:
+                format_fasta(f, seq_id, seq_with_tag, description)
             print(f"Zapisano sekwencję do pliku: {filepath}")
         except IOError as e:
             print(f"Błąd zapisu pliku {filepath}: {e}")